@@ -1,16 +1,186 @@
 #!/usr/bin/env python3
 
-import logging, multiprocessing, re, signal
-import textwrap, threading, os, time, yaml
-
-from datetime import datetime, timedelta
-from functools import wraps, partial
+import atexit, logging, multiprocessing, queue, re, selectors, signal
+import requests, textwrap, threading, os, time, yaml
+
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial, reduce, wraps
+from itertools import chain
+from json import dumps as json_dumps, loads as json_loads
+from logging.handlers import QueueHandler, QueueListener
 #from future.standard_library import install_aliases
 from oglhclient import LighthouseApiClient
-from slackclient import SlackClient
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+from slackclient import SlackClient, slackrequest
+from urllib3.util.retry import Retry
 
 #install_aliases()
 
+# orjson parses the Lighthouse responses several times faster, when available
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json_loads
+
+# slack formatted entities like <url|link-label>, no '>' can be inside them
+# since slack escapes it
+_SANITISE_RE = re.compile(r'^<[^>]*\|([^|>]*)>$')
+# runs of whitespace in a command
+_WHITESPACE_RE = re.compile(r'\s+')
+# commands filtered by smartgroup, like 'nodes in MySmartGroup'
+_QUERY_SMARTGROUP_RE = re.compile(r'.*\s+in\s+\w+')
+_SCOPE_SMARTGROUP_RE = re.compile(r'.*in\s+\w+')
+# 'devices on <node>', the same as 'devices <node>'
+_DEVICES_ON_RE = re.compile(r'devices\s+on\s+')
+
+# api objects whose plural is not built by the rules in _plural
+_PLURALS = { 'system': 'system' }
+
+# replies shared by the built in functions
+_MSG_EVALUATION = '*WARNING:* Lighthouse is currently running in ' \
+    'evaluation mode. :slightly_frowning_face:\n'
+_MSG_DEVICE_NOT_FOUND = ':x: Device not found: %s. Unable to create %s.'
+_MSG_APPROVE_OK = ':white_check_mark: Success: Node approved.'
+_MSG_APPROVE_FAIL = ':x: Error: Node could not be approved. ' \
+    'Please check it and try again.'
+_MSG_DELETE_OK = ':white_check_mark: Success: %s.'
+_MSG_DELETE_FAIL = ':x: Error: It was not possible to unenroll %s.'
+_MSG_NO_NAMES = ':x: Give one or more node names.'
+_MSG_PENDING = ':warning: There are some nodes waiting for approval.\n'
+_MSG_NO_PENDING = ':white_check_mark: No pending nodes to approve.'
+_MSG_STALE = ':warning: Lighthouse cannot be reached right now, ' \
+    'this might be out of date.\n'
+_MSG_BUSY = ':warning: Too many commands are running right now, ' \
+    'please try again in a moment.'
+
+# a code block, for content starting with a new line
+_CODE_BLOCK = '\n```%s\n```\n'
+# messages for the log channels, by bot name and message
+_MSG_DYING = '\n@%s  went offline with error message:\n```\n%s\n```\n'
+_MSG_LOG = '\n@%s  would like you to know:\n\n> %s\n\n'
+
+# query actions whose reply is an object worth describing in full
+_DUMP_ACTIONS = frozenset(('find', 'get', 'update', 'create'))
+
+# the built in commands as (command, description, aliases), for the help
+_BUILT_IN_COMMANDS = (
+    ('devices',
+        'Shows all the managed devices available (SG)',
+        'ports, labels'),
+    ('device-info <device>',
+        'Shows the description of a device (SG)',
+        ''),
+    ('devices on <node>',
+        'Shows the node\'s devices (SG)',
+        'node-ports <node>'),
+    ('ssh <device>',
+        'Gets a SSH link for managed Device (SG)',
+        'sshlink <device>'),
+    ('web <device>',
+        'Gets a web terminal link for managed device (SG)',
+        'webterm <device>, weblink <device>'),
+    ('con <device>',
+        'Gets both a SSH link and a web terminal link for managed device (SG)',
+        ''),
+    ('status',
+        'Shows nodes enrollment and licensing summary',
+        'console <device>, gimme <device>'),
+    ('gui',
+        'Gets a link to the Lighthouse web UI',
+        'lighthouse, lhweb, webui'),
+    ('gui <node>',
+        'Gets a link to the node\'s proxied web UI',
+        ''),
+    ('nodes',
+        'Shows enrolled nodes (SG)',
+        'summary, stats, status, howzit'),
+    ('node-info <node>',
+        'Shows the node\'s description',
+        'desc <node>'),
+    ('pending',
+        'Shows nodes awaiting approval (SG)',
+        'enrolled'),
+    ('approve <node>',
+        'Approves a node or a whitespace separated list of nodes (admin only)',
+        'okay <node>, approve <node>'),
+    ('delete <node>',
+        'Unenrolls a node or a whitespace separated list of nodes (admin only)',
+        'kill <node>, delete <node>'),
+    ('smart-groups',
+        'Shows the list of smartgroups',
+        'smart'),
+    ('smart-group-nodes <smartgroup>',
+        'Shows the nodes belonging to a smartgroup',
+        'smart-nodes, smartgroupnodes'),
+    ('advanced',
+        'Describes some advanced commands',
+        'advanced-help'),
+)
+
+# what a slack web api call raises, failing requests or a reply which is not
+# json
+_SLACK_ERRORS = (RequestException, ValueError)
+
+# threads for running independent Lighthouse requests at the same time, it
+# also bounds how many requests the bot makes to Lighthouse at once
+_EXECUTOR = ThreadPoolExecutor(max_workers=8)
+
+# nodes requested per page when looking for a single node in a listing which
+# is not cached
+_NODES_PAGE_SIZE = 200
+
+@lru_cache(maxsize=1024)
+def _record_type(fields):
+    """the namedtuple class for a set of json object keys, built only once
+    per set of keys"""
+    return namedtuple('X', fields)
+
+def _to_records(obj):
+    """turns parsed json into namedtuples, like the Lighthouse client does"""
+    if isinstance(obj, dict):
+        return _record_type(tuple(obj))(*[_to_records(v) for v in obj.values()])
+    if isinstance(obj, list):
+        return [_to_records(v) for v in obj]
+    return obj
+
+def _parse_response(response):
+    """a faster replacement for LighthouseApiClient._parse_response, with
+    the same result
+
+    :response is the requests' response of a Lighthouse api call
+    """
+    try:
+        return _to_records(_json_loads(response.content))
+    except ValueError:
+        return response.text
+
+def _check(body):
+    """raises LighthouseError when :body is an error reply from Lighthouse,
+    otherwise it returns :body"""
+    error = getattr(body, 'error', None)
+    if error:
+        raise LighthouseError('Lighthouse says: %s' % error[0].text)
+    return body
+
+@lru_cache(maxsize=256)
+def _plural(word):
+    """the api plural of :word, worked out once per word, see
+    OgLhSlackBot._dummy_plural"""
+    if word in _PLURALS:
+        return _PLURALS[word]
+    if word[-1] == 'y':
+        return word[:-1] + 'ies'
+    elif word[-1] == 's':
+        return word
+    return word + 's'
+
+def _ci_sort(names):
+    """sorts :names regardless of the case, str.casefold is a builtin so no
+    python function is called per name"""
+    return sorted(names, key=str.casefold)
+
 def retry(tries=5, delay=3, backoff=2, logger=None):
     """Retry calling the decorated function using an exponential backoff.
 
@@ -29,7 +199,7 @@ def retry(tries=5, delay=3, backoff=2, logger=None):
             while mtries > 1:
                 try:
                     return f(*args, **kwargs)
-                except:
+                except Exception:
                     time.sleep(mdelay)
                     mtries -= 1
                     mdelay *= backoff
@@ -37,27 +207,256 @@ def retry(tries=5, delay=3, backoff=2, logger=None):
         return f_retry
     return deco_retry
 
+def cached_reply(f):
+    """keeps the replies of a built in function in the bot's :replies cache,
+    by scope and smartgroup, so that the same command asked again shortly
+    is answered at once
+
+    WARNING: the username is not part of the key, so replies depending on it
+    must not be cached
+    """
+    @wraps(f)
+    def f_cached(self, *args):
+        key = (f.__name__,) + args[:2]
+        reply = self.replies.get(key)
+        if reply is None:
+            # replies built from stale answers are not kept, so the tracking
+            # starts again for f and is merged back with the earlier one
+            helper = self.client_helper
+            stale = helper.served_stale()
+            helper.begin_request()
+            reply = f(self, *args)
+            if helper.served_stale():
+                stale = True
+            else:
+                self.replies.set(key, reply)
+            helper.request_state.stale = stale
+        return reply
+    return f_cached
+
+class SlackSessionRequest(slackrequest.SlackRequest):
+    """A SlackRequest posting through its own requests session, slackclient
+    makes every web api call through requests.post, which opens a new
+    connection each time, while the session keeps them alive between calls
+
+    Usage:
+
+    >>> slack_client = SlackClient(token)
+    >>> slack_client.server.api_requester = SlackSessionRequest()
+    """
+
+    def __init__(self, proxies=None):
+        slackrequest.SlackRequest.__init__(self, proxies=proxies)
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=32))
+
+    def do(self, token, request='?', post_data=None, domain='slack.com', \
+        timeout=None):
+        """posts :request to the slack web api, like SlackRequest.do"""
+        post_data = dict(post_data or {})
+        files = None
+        if request == 'files.upload' and 'file' in post_data:
+            files = { 'file': post_data.pop('file') }
+        for key, value in post_data.items():
+            if not isinstance(value, str):
+                post_data[key] = json_dumps(value)
+        post_data['token'] = token
+
+        return self.session.post('https://%s/api/%s' % (domain, request), \
+            headers={ 'user-agent': self.get_user_agent() }, \
+            data=post_data, files=files, timeout=timeout, \
+            proxies=self.proxies)
+
 class LighthouseError(Exception):
     def __init__(self, *args, **kwargs):
         Exception.__init__(self, *args, **kwargs)
 
+class TTLCache:
+    """A thread safe mapping whose entries expire :ttl seconds after being
+    set, holding :maxsize entries at most, the least recently used ones are
+    dropped first; expired entries are still given by get_stale during
+    :stale_ttl seconds
+
+    Usage:
+
+    >>> cache = TTLCache(ttl=5)
+    >>> cache.set('key', 'value')
+    >>> cache.get('key')
+    """
+
+    def __init__(self, ttl, maxsize=128, stale_ttl=60 * 60):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stale_ttl = stale_ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """returns the value kept for :key, or None if missing or expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry or entry[0] <= time.monotonic():
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def get_stale(self, key):
+        """returns the value kept for :key even if expired, or None if it was
+        never set, already dropped or expired more than :stale_ttl ago"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry or entry[0] + self.stale_ttl <= time.monotonic():
+                return None
+            return entry[1]
+
+    def set(self, key, value):
+        """keeps :value for :key during the next :ttl seconds"""
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def update(self, items, replace=False):
+        """keeps every (key, value) of :items as set would, dropping all the
+        other entries first when :replace is True"""
+        with self.lock:
+            if replace:
+                self.entries.clear()
+            expiry = time.monotonic() + self.ttl
+            for key, value in items:
+                self.entries[key] = (expiry, value)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def pop(self, key):
+        """drops the entry for :key, if any"""
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def discard(self, predicate):
+        """drops the entries whose key :predicate returns True for"""
+        with self.lock:
+            for key in [key for key in self.entries if predicate(key)]:
+                del self.entries[key]
+
+    def keys(self):
+        """returns the keys of the entries, expired ones included"""
+        with self.lock:
+            return list(self.entries)
+
+    def clear(self):
+        """drops every entry"""
+        with self.lock:
+            self.entries.clear()
+
 class OgLhClientHelper:
     def __init__(self):
         self.lh_api = LighthouseApiClient()
+        self.lh_api._parse_response = _parse_response
+        # every api call goes through the client's session, so size its
+        # connection pool for the concurrent command threads and keep the
+        # connections alive between calls
+        adapter = HTTPAdapter( \
+            pool_connections=int(os.environ.get('OGLH_POOL_CONNECTIONS', 4)), \
+            pool_maxsize=int(os.environ.get('OGLH_POOL_MAXSIZE', 32)), \
+            max_retries=Retry(total=3, backoff_factor=0.2), pool_block=False)
+        self.lh_api.s.mount('https://', adapter)
+        self.lh_api.s.mount('http://', adapter)
         self.url = self.lh_api.url
         self.client = self.lh_api.get_client()
-        self.pending_name_ids = {}
+        self.pending_names = frozenset()
+        self.pending_lock = threading.Lock()
+        # smartgroups listing and its queries by lowercase name
+        self.smart_group_queries = (None, {})
+        # per thread, whether a stale answer was given since begin_request
+        # because Lighthouse failed, see _cached_call and _nodes_entry
+        self.request_state = threading.local()
+        # last seen node objects by name, see _remember_nodes; a node deleted
+        # and enrolled again outside the bot gets a new id, so they expire
+        self.known_nodes = TTLCache(ttl=60, maxsize=4096)
+        # recent answers by endpoint, see _cached_call and _list_nodes
+        self.caches = {
+            'nodes': TTLCache(ttl=5),
+            'node_ids': TTLCache(ttl=60, maxsize=256),
+            'object_ids': TTLCache(ttl=60, maxsize=256),
+            'ports': TTLCache(ttl=5),
+            'summary': TTLCache(ttl=5),
+            'smartgroups': TTLCache(ttl=120),
+            'licenses': TTLCache(ttl=600),
+            'entitlements': TTLCache(ttl=600)
+        }
+        # last evaluation mode check as (value, expiry), see is_evaluation
+        self.evaluation = None
+        self.evaluation_ttl = 5 * 60
+        self.evaluation_lock = threading.Lock()
+        self.evaluation_refreshing = False
         #_, _ = self.get_pending()
 
+    def begin_request(self):
+        """starts tracking on the current thread whether stale answers are
+        given, see served_stale"""
+        self.request_state.stale = False
+
+    def served_stale(self):
+        """returns True when some answer given on the current thread since
+        begin_request was stale, because Lighthouse could not be reached"""
+        return getattr(self.request_state, 'stale', False)
+
+    def _tracked(self, call):
+        """returns (:call(), whether it gave stale answers), for calls run
+        on the executor, whose threads do not share the caller's tracking"""
+        self.begin_request()
+        return call(), self.served_stale()
+
+    def _tracked_result(self, future):
+        """returns the result of a future running _tracked, marking the
+        current thread's answers stale when the call's were"""
+        result, stale = future.result()
+        if stale:
+            self.request_state.stale = True
+        return result
+
+    def invalidate(self):
+        """drops the cached answers that change along with the nodes, it must
+        be called after changing nodes"""
+        self.caches['nodes'].clear()
+        self.caches['node_ids'].clear()
+        self.caches['object_ids'].clear()
+        self.caches['ports'].clear()
+        self.caches['summary'].clear()
+
+    def _cached_call(self, endpoint, call, *args, **kwargs):
+        """returns :call(*args, **kwargs), unless the same call was answered
+        less than the :endpoint cache ttl ago, errors are never cached
+
+        :endpoint is the name of the cache in self.caches
+        :call is the client function, like self.client.system.licenses.list
+        """
+        key = (tuple(tuple(sorted(a.items())) if isinstance(a, dict) else a \
+            for a in args), tuple(sorted(kwargs.items())))
+        body = self.caches[endpoint].get(key)
+        if body is None:
+            try:
+                body = call(*args, **kwargs)
+            except RequestException:
+                # the last known answer is better than none
+                body = self.caches[endpoint].get_stale(key)
+                if body is None:
+                    raise
+                self.request_state.stale = True
+                return body
+            self.caches[endpoint].set(key, _check(body))
+        return body
+
     def get_smart_groups(self):
         """returns a list of smartgroups"""
         try:
-            body = self.client.nodes.smartgroups.list()
-            if 'error' in body._asdict():
-                raise LighthouseError('Lighthouse says: %s' \
-                    % body.error[0].text)
+            body = self._cached_call('smartgroups', \
+                self.client.nodes.smartgroups.list)
             return sorted([s.name for s in body.smartgroups])
-        except LighthouseError as error:
+        except (LighthouseError, RequestException) as error:
             raise error
         except:
             return None
@@ -69,14 +468,9 @@ class OgLhClientHelper:
         """
         try:
             query = self.get_smart_group_query(smartgroup)
-            body = self.client.nodes.list(json=query)
-            if 'error' in body._asdict():
-                raise LighthouseError('Lighthouse says: %s' \
-                    % body.error[0].text)
-            nodes = body.nodes
-            node_names = [n.name for n in nodes]
-            return sorted(node_names, key=lambda k: k.lower())
-        except LighthouseError as error:
+            node_names = [n.name for n in self._list_nodes(json=query)]
+            return _ci_sort(node_names)
+        except (LighthouseError, RequestException) as error:
             raise error
         except:
             return None
@@ -89,15 +483,19 @@ class OgLhClientHelper:
         if not smartgroup:
             return ''
         try:
-            body = self.client.nodes.smartgroups.list()
-            if 'error' in body._asdict():
-                raise LighthouseError('Lighthouse says: %s' \
-                    % body.error[0].text)
-
-            for s in body.smartgroups:
-                if s.name.lower() == smartgroup.lower():
-                    return s.query
-        except LighthouseError as error:
+            body = self._cached_call('smartgroups', \
+                self.client.nodes.smartgroups.list)
+
+            # the queries are indexed once per listing of the smartgroups
+            indexed = self.smart_group_queries
+            if indexed[0] is not body:
+                indexed = (body, { s.name.lower(): s.query \
+                    for s in body.smartgroups })
+                self.smart_group_queries = indexed
+            query = indexed[1].get(smartgroup.lower())
+            if query is not None:
+                return query
+        except (LighthouseError, RequestException) as error:
             raise error
         except:
             return ''
@@ -114,12 +512,11 @@ class OgLhClientHelper:
         >>> ports = slack_bot.get_ports('mySoughtLabel')
         """
         query = self.get_smart_group_query(smartgroup)
-        body = self.client.nodes.list({ 'port:label': label }, json=query)
-        if 'error' in body._asdict():
-            raise LighthouseError('Lighthouse says: %s' % body.error[0].text)
+        nodes = self._list_nodes({ 'port:label': label }, json=query)
 
-        return [port for node in body.nodes for port in node.ports \
-            if port.label.lower() == label.lower()]
+        label = label.lower()
+        return [port for node in nodes for port in node.ports \
+            if port.label.lower() == label]
 
     def get_pending(self, smartgroup=None):
         """a list of names of the pending nodes (waiting for approval)
@@ -135,18 +532,15 @@ class OgLhClientHelper:
             was instantiated, and False otherwise
         """
         query = self.get_smart_group_query(smartgroup)
+        nodes = self._list_nodes(json=query)
 
-        body = self.client.nodes.list(json=query)
-        if 'error' in body._asdict():
-            raise LighthouseError('Lighthouse says: %s' % body.error[0].text)
-
-        name_ids = { node.name: node.id for node in body.nodes \
-            if node.approved == 0 }
-        #new_pending = (set(name_ids) > set(self.pending_name_ids))
-        new_pending = len([k for k,_ in name_ids.items() \
-            if not k in self.pending_name_ids.keys()]) > 0
-        self.pending_name_ids = name_ids
-        return sorted(name_ids, key=lambda k: k.lower()), new_pending
+        names = frozenset(node.name for node in nodes if node.approved == 0)
+        # the sweep and the users' commands may check at the same time, and
+        # a new node must be reported as new only once
+        with self.pending_lock:
+            new_pending = not names <= self.pending_names
+            self.pending_names = names
+        return _ci_sort(names), new_pending
 
     def get_enrolled(self, smartgroup=None):
         """A list of current enrolled nodes
@@ -160,11 +554,11 @@ class OgLhClientHelper:
         @enrolled_node_names is a list of the currently enrolled nodes
         """
         query = self.get_smart_group_query(smartgroup)
-        body = self.client.nodes.list({ 'config:status' : 'Enrolled' }, \
-            json=query)
-        if 'error' in body._asdict():
-            raise LighthouseError('Lighthouse says: %s' % body.error[0].text)
-        return sorted([node.name for node in body.nodes])
+        # the same listing as get_pending's, filtered here rather than by
+        # Lighthouse, so that both commands make a single request
+        return self._nodes_view('enrolled', \
+            lambda nodes: sorted([node.name for node in nodes \
+                if getattr(node, 'status', None) == 'Enrolled']), json=query)
 
     def get_node_id(self, node_name):
         """Returns the node id given its name
@@ -175,15 +569,27 @@ class OgLhClientHelper:
 
         >>> node_id = slack_bot.get_node_id('myNodeName')
         """
+        # a name keeps its id unless the node is enrolled again, so the same
+        # names are not sought again for a while
+        node_id = self.caches['node_ids'].get(node_name)
+        if node_id:
+            return node_id
+        # any listing of the node, like the pending sweep's, tells its id too
+        nodes = self._recall_nodes({ node_name }, \
+            lambda node: getattr(node, 'status', None) == 'Enrolled')
+        if nodes:
+            self.caches['node_ids'].set(node_name, nodes[0].id)
+            return nodes[0].id
         try:
-            body = self.client.nodes.list({ 'config:status' : 'Enrolled' })
-            if 'error' in body._asdict():
-                raise LighthouseError('Lighthouse says: %s' \
-                    % body.error[0].text)
-            for node in body.nodes:
+            # only the sought node is listed, the name filter might match
+            # partially though
+            nodes = self._list_nodes({ 'config:status' : 'Enrolled', \
+                'config:name' : node_name })
+            for node in nodes:
                 if node.name == node_name:
+                    self.caches['node_ids'].set(node_name, node.id)
                     return node.id
-        except LighthouseError as error:
+        except (LighthouseError, RequestException) as error:
             raise error
         except:
             pass
@@ -206,26 +612,21 @@ class OgLhClientHelper:
         """
         try:
             query = self.get_smart_group_query(smartgroup)
-            nodes = []
+            sought = node_name.lower() if node_name else None
 
-            if node_name:
-                body = self.client.nodes.list({ 'config:name' : node_name }, \
-                    json=query)
-            else:
-                body = self.client.nodes.list(json=query)
-
-            if 'error' in body._asdict():
-                raise LighthouseError('Lighthouse says: %s' \
-                    % body.error[0].text)
+            def sorted_labels(nodes):
+                #labels = [port.label for node in nodes for port \
+                #        in node.ports if port.mode == 'consoleServer']
+                labels = [port.label for node in nodes for port \
+                    in node.ports if (not sought \
+                    or port.node_name.lower() == sought)]
+                return sorted(labels)
 
-            nodes = body.nodes
-            #labels = [port.label for node in nodes for port \
-            #        in node.ports if port.mode == 'consoleServer']
-            labels = [port.label for node in nodes for port \
-                in node.ports if \
-                (port.node_name.lower() == node_name.lower() or not node_name)]
-            return sorted(labels)
-        except LighthouseError as error:
+            if node_name:
+                return self._nodes_view('labels', sorted_labels, \
+                    { 'config:name' : node_name }, json=query)
+            return self._nodes_view('labels', sorted_labels, json=query)
+        except (LighthouseError, RequestException) as error:
             raise error
         except:
             return None
@@ -242,19 +643,13 @@ class OgLhClientHelper:
         @pending is the number of pending nodes
         @disconnected is the number of disconnected nodes
         """
-        body = self.client.stats.nodes.connection_summary.get()
-        if 'error' in body._asdict():
-            raise LighthouseError('Lighthouse says: %s' % body.error[0].text)
-
-        for conn in body.connectionSummary:
-            if conn.status == 'connected':
-                connected = int(conn.count)
-            elif conn.status == 'pending':
-                pending = int(conn.count)
-                continue
-            elif conn.status == 'disconnected':
-                disconnected = int(conn.count)
-        return connected, pending, disconnected
+        body = self._cached_call('summary', \
+            self.client.stats.nodes.connection_summary.get)
+
+        counts = { conn.status: int(conn.count) \
+            for conn in body.connectionSummary }
+        return counts.get('connected', 0), counts.get('pending', 0), \
+            counts.get('disconnected', 0)
 
     def delete_nodes(self, node_names):
         """Delete or disconnect a list of nodes specified by their names
@@ -269,24 +664,12 @@ class OgLhClientHelper:
 
         @deleted_list is a subset of :node_names with those which were deleted
         """
-        body = self.client.nodes.list()
-        if 'error' in body._asdict():
-            raise LighthouseError('Lighthouse says: %s' % body.error[0].text)
-
-        deleted_names = []
-        errors = []
-        for node in body.nodes:
-            if node.name in node_names:
-                try:
-                    result = self.client.nodes.delete(id=node.id)
-                    if 'error' in result._asdict() \
-                        and len(result.error) > 0:
-                        raise RuntimeError(result.error[0].text)
-                    deleted_names.append(node.name)
-                except Exception as e:
-                    errors.append('Error deleting [%s]: %s' % \
-                        (node.name, str(e)))
-        return deleted_names, errors
+        node_names = set(node_names)
+        nodes = self._recall_nodes(node_names)
+        if nodes is None:
+            nodes = [node for node in self._list_nodes() \
+                if node.name in node_names]
+        return self._map_nodes(self._delete_node, nodes, 'deleting')
 
     def approve_nodes(self, node_names):
         """Approve or enroll a list of nodes specified by their names
@@ -301,44 +684,256 @@ class OgLhClientHelper:
 
         @approved_list is a subset of :node_names with those which were approved
         """
-        body = self.client.nodes.list({ 'config:status' : 'Registered' })
-        if 'error' in body._asdict():
-            raise LighthouseError('Lighthouse says: %s' % body.error[0].text)
+        node_names = set(node_names)
+        nodes = self._recall_nodes(node_names, \
+            lambda node: node.approved == 0)
+        if nodes is None:
+            nodes = [node for node in self._list_nodes() \
+                if node.approved == 0 and node.name in node_names]
+        return self._map_nodes(self._approve_node, nodes, 'approving')
+
+    def _list_nodes(self, params=None, **kwargs):
+        """returns the nodes listed by Lighthouse for the same arguments as
+        self.client.nodes.list(), the listing is shared during the ttl of the
+        nodes cache, so that commands and the pending sweep close to each
+        other make a single request
+
+        :params is a dict of filters like { 'config:status' : 'Enrolled' }
+        :kwargs are passed on as they are, like the smartgroup json query
+        """
+        return self._nodes_entry(params, kwargs)[0]
+
+    def _nodes_view(self, view, build, params=None, **kwargs):
+        """returns build(nodes) for the nodes listed as in _list_nodes, the
+        result is kept along with the listing, so that repeated commands do
+        not sort the same names again
+
+        :view is a name identifying :build among the views of a listing
+        :build is a function taking the list of nodes
+        """
+        nodes, views = self._nodes_entry(params, kwargs)
+        if view not in views:
+            views[view] = build(nodes)
+        return views[view]
+
+    def _iter_nodes(self, params=None, page_size=_NODES_PAGE_SIZE, **kwargs):
+        """yields the nodes listed as in _list_nodes, when the listing is not
+        cached they are requested a page at a time, so that looking for a
+        single node stops before the whole inventory is transferred
 
-        approved_names = []
+        :page_size is the number of nodes requested per page
+        """
+        key = self._nodes_key(params, kwargs)
+        entry = self.caches['nodes'].get(key)
+        if entry:
+            yield from entry[0]
+            return
+
+        page = 1
+        first_id = None
+        while True:
+            try:
+                body = self.client.nodes.list(dict(params or {}, \
+                    per_page=page_size, page=page), **kwargs)
+            except RequestException:
+                entry = self.caches['nodes'].get_stale(key)
+                if page > 1 or entry is None:
+                    raise
+                self.request_state.stale = True
+                yield from entry[0]
+                return
+            _check(body)
+
+            # a Lighthouse ignoring the paging would give the same nodes
+            # over and over, so it stops there as well as at the last page
+            nodes = body.nodes
+            if not nodes or nodes[0].id == first_id:
+                return
+            first_id = nodes[0].id
+            self._remember_nodes(nodes)
+            yield from nodes
+            total_pages = getattr(getattr(body, 'meta', None), \
+                'total_pages', None)
+            if len(nodes) != page_size or (total_pages is not None \
+                and page >= int(total_pages)):
+                return
+            page += 1
+
+    def _named_nodes(self, node_name, **kwargs):
+        """yields the nodes Lighthouse finds by :node_name, the request is
+        only made once the first node is wanted and it yields nothing when
+        Lighthouse cannot be reached
+
+        :node_name is the name filtered on, as Lighthouse compares it
+        """
+        try:
+            yield from self._list_nodes({ 'config:name' : node_name }, \
+                **kwargs)
+        except (LighthouseError, RequestException):
+            # the listing read next serves stale nodes if it has to
+            return
+
+    def _nodes_key(self, params, kwargs):
+        """returns the nodes cache key for a listing"""
+        return (tuple(sorted((params or {}).items())), \
+            tuple(sorted(kwargs.items())))
+
+    def _nodes_entry(self, params, kwargs):
+        """returns the cache entry (nodes, views) for a listing, requesting
+        the nodes from Lighthouse when it is missing or expired"""
+        key = self._nodes_key(params, kwargs)
+        entry = self.caches['nodes'].get(key)
+        if entry:
+            return entry
+
+        args = (params,) if params else ()
+        try:
+            body = self.client.nodes.list(*args, **kwargs)
+        except RequestException:
+            # the last known listing is better than none
+            entry = self.caches['nodes'].get_stale(key)
+            if entry is None:
+                raise
+            self.request_state.stale = True
+            return entry
+        _check(body)
+
+        # a listing of every node tells which nodes are gone too
+        self._remember_nodes(body.nodes, \
+            complete=not params and not kwargs.get('json'))
+        entry = (body.nodes, {})
+        self.caches['nodes'].set(key, entry)
+        return entry
+
+    def _remember_nodes(self, nodes, complete=False):
+        """keeps the last seen version of :nodes, so that approving or
+        deleting them later does not require listing all nodes again
+
+        :nodes is a list of node objects as listed by Lighthouse
+        :complete if True, :nodes are all the nodes and the ones remembered
+        but missing from them are forgotten, along with the ids found for
+        their names
+        """
+        if complete:
+            # a node enrolled again under the same name has a new id, so it
+            # counts as gone as well
+            listed = { node.name : node.id for node in nodes }
+            gone = set(name for name in self.known_nodes.keys() \
+                if name not in listed or getattr(self.known_nodes. \
+                get_stale(name), 'id', listed[name]) != listed[name])
+        self.known_nodes.update(((node.name, node) for node in nodes), \
+            replace=complete)
+        if complete and gone:
+            self.caches['node_ids'].discard(lambda name: name in gone)
+            self.caches['object_ids'].discard(lambda key: \
+                key[0] == 'nodes' and key[1] in gone)
+
+    def _recall_nodes(self, node_names, accept=None):
+        """returns the remembered nodes named in :node_names, or None when
+        some of them is unknown and the nodes must be listed again
+
+        :node_names is a set of node names
+        :accept if specified, remembered nodes for which it returns False are
+        treated as unknown
+        """
+        nodes = [self.known_nodes.get(name) for name in node_names]
+        if all(node and (not accept or accept(node)) for node in nodes):
+            return nodes
+        return None
+
+    def _delete_node(self, node):
+        """deletes a single node, returning its name on success
+
+        :node is the node object as listed by Lighthouse
+        """
+        result = self.client.nodes.delete(id=node.id)
+        error = getattr(result, 'error', None)
+        if error:
+            raise RuntimeError(error[0].text)
+        return node.name
+
+    def _approve_node(self, node):
+        """approves a single node, returning its name on success
+
+        :node is the node object as listed by Lighthouse
+        """
+        approved_node = {
+            'node': {
+                'name': node.name,
+                'mac_address': '',
+                'description': '',
+                'approved': 1,
+                'tags': node.tag_list.tags
+            }
+        }
+        result = self.client.nodes.update(data=approved_node, id=node.id)
+        error = getattr(result, 'error', None)
+        if error:
+            raise RuntimeError(error[0].text)
+        return node.name
+
+    def _call_on_node(self, func, node):
+        """returns :func(:node), trying once more with the node as Lighthouse
+        lists it now when that fails, since :node might have been remembered
+        with the id of a node deleted and enrolled again meanwhile
+
+        :func is the function applied to the node, like _delete_node
+        :node is the node object as listed by Lighthouse
+        """
+        try:
+            return func(node)
+        except Exception:
+            self.known_nodes.pop(node.name)
+            try:
+                body = _check(self.client.nodes.list(\
+                    { 'config:name' : node.name }))
+                fresh = [n for n in body.nodes if n.name == node.name]
+            except Exception:
+                fresh = None
+            if not fresh or fresh[0].id == node.id:
+                raise
+        return func(fresh[0])
+
+    def _map_nodes(self, func, nodes, action):
+        """calls :func for every node concurrently, since each call is an
+        independent round trip to Lighthouse
+
+        :func is the function applied to each node, returning the node's name
+        :nodes is a list of node objects
+        :action is a description of :func used in the error messages
+
+        @names is a list of names of the nodes for which :func succeeded
+        @errors is a list of error messages for the nodes for which it failed
+        """
+        names = []
         errors = []
-        for node in body.nodes:
-            if node.name in node_names:
-                try:
-                    approved_node = {
-                        'node': {
-                            'name': node.name,
-                            'mac_address': '',
-                            'description': '',
-                            'approved': 1,
-                            'tags': node.tag_list.tags
-                        }
-                    }
-                    result = self.client.nodes.update(data=approved_node, \
-                        id=node.id)
-                    if 'error' in result._asdict() \
-                        and len(result.error) > 0:
-                        raise RuntimeError(result.error[0].text)
-                    approved_names.append(node.name)
-                except Exception as e:
-                    errors.append('Error approving [%s]: %s' % (node.name, \
-                        str(e)))
-        return approved_names, errors
+        if not nodes:
+            return names, errors
+
+        futures = [(node, _EXECUTOR.submit(self._call_on_node, func, node)) \
+            for node in nodes]
+
+        for node, future in futures:
+            try:
+                names.append(future.result())
+            except Exception as e:
+                errors.append('Error %s [%s]: %s' % (action, node.name, \
+                    str(e)))
+
+        # the changed nodes are not worth remembering anymore
+        for name in names:
+            self.known_nodes.pop(name)
+        if names:
+            self.invalidate()
+        return names, errors
 
     def get_licenses(self):
         """returns the license keys related to the regarding lighthouse"""
         try:
-            body = self.client.system.licenses.list()
-            if 'error' in body._asdict():
-                raise LighthouseError('Lighthouse says: %s' \
-                    % body.error[0].text)
+            body = self._cached_call('licenses', \
+                self.client.system.licenses.list)
             return body.licenses
-        except LighthouseError as error:
+        except (LighthouseError, RequestException) as error:
             raise error
         except:
             return None
@@ -346,25 +941,53 @@ class OgLhClientHelper:
     def get_entitlements(self):
         """returns the entitlements related to the regarding lighthouse"""
         try:
-            body = self.client.system.entitlements.list()
-            if 'error' in body._asdict():
-                raise LighthouseError('Lighthouse says: %s' \
-                    % body.error[0].text)
+            body = self._cached_call('entitlements', \
+                self.client.system.entitlements.list)
             return body.entitlements
-        except LighthouseError as error:
+        except (LighthouseError, RequestException) as error:
             raise error
         except:
             return None
 
     def is_evaluation(self):
-        """check whether the user is in evaluation mode"""
+        """check whether the user is in evaluation mode, once the last check
+        is older than :evaluation_ttl its answer is still given while a new
+        check runs in background, since licenses rarely change
+        """
+        with self.evaluation_lock:
+            cached = self.evaluation
+            refresh = cached is not None and not self.evaluation_refreshing \
+                and cached[1] <= time.monotonic()
+            if refresh:
+                self.evaluation_refreshing = True
+
+        if cached is None:
+            return self._check_evaluation()
+        if refresh:
+            _EXECUTOR.submit(self._check_evaluation)
+        return cached[0]
+
+    def _check_evaluation(self):
+        """asks Lighthouse whether the user is in evaluation mode, keeping
+        the answer for is_evaluation"""
+        try:
+            evaluation = self._is_evaluation()
+            with self.evaluation_lock:
+                self.evaluation = \
+                    (evaluation, time.monotonic() + self.evaluation_ttl)
+            return evaluation
+        finally:
+            with self.evaluation_lock:
+                self.evaluation_refreshing = False
+
+    def _is_evaluation(self):
         try:
             licenses = self.get_licenses()
             for l in licenses:
                 if len(l.raw) > 0:
                     return False
             raise
-        except LighthouseError as error:
+        except (LighthouseError, RequestException) as error:
             raise error
         except:
             return True
@@ -373,13 +996,10 @@ class OgLhClientHelper:
         """check whether the user license is still valid, which means it is
         not expired neither exceeding maximum nodes number"""
         try:
+            # both requests are independent, so they run at the same time
+            nodes = _EXECUTOR.submit(self._tracked, self._list_nodes)
             entitlements = self.get_entitlements()
-            body = self.client.nodes.list()
-            if 'error' in body._asdict():
-                raise LighthouseError('Lighthouse says: %s' \
-                    % body.error[0].text)
-
-            nodes_count = len(body.nodes)
+            nodes_count = len(self._tracked_result(nodes))
             is_valid = False
 
             for e in entitlements:
@@ -389,7 +1009,7 @@ class OgLhClientHelper:
                     is_valid |= (time.time() <= int(e.features.maintenance) \
                         and int(e.features.nodes) >= nodes_count)
             return is_valid
-        except LighthouseError as error:
+        except (LighthouseError, RequestException) as error:
             raise error
         except:
             return False
@@ -406,152 +1026,131 @@ class OgLhClientHelper:
         :parent_id if the parent id is known, it might reduce the cost of
         finding it
         """
+        # the same objects tend to be queried in a row, like a node's tags
+        # and then one of them
+        key = (object_type, object_name, parent_type, parent_name, parent_id)
+        object_id = self.caches['object_ids'].get(key)
+        if object_id:
+            return object_id
         try:
             if parent_type and parent_name and not parent_id:
                 parent_id = self.get_object_id(parent_type, parent_name)
 
-            chain = []
-            params = []
+            attr_chain = []
+            kwargs = {}
             if parent_type:
-                chain.append(parent_type)
-                params.append('parent_id=' + parent_id)
-            chain.append(object_type)
+                attr_chain.append(parent_type)
+                kwargs['parent_id'] = parent_id
+            attr_chain.append(object_type)
 
-            call_str = 'self.client.{chain}.list({params})'
-            r = eval(str.format(call_str, chain='.'.join(chain), \
-                params=','.join(params)))
-            if 'error' in r._asdict():
-                raise LighthouseError('Lighthouse says: %s' % r.error[0].text)
+            r = _check(reduce(getattr, attr_chain, self.client).list(**kwargs))
 
-            for o in r._asdict()[object_type]:
+            for o in getattr(r, object_type):
                 obj_label = ''
                 for label in ['name', 'label', 'username', 'groupname']:
-                    if label in o._asdict():
+                    if hasattr(o, label):
                         obj_label = label
                         break
 
-                if o._asdict()[obj_label] == object_name:
+                if getattr(o, obj_label) == object_name:
+                    self.caches['object_ids'].set(key, o.id)
                     return o.id
-        except LighthouseError as error:
-            raise error
-        except:
+        except (AttributeError, IndexError, KeyError, TypeError):
+            # objects which cannot be listed by name
             return object_name
 
     def get_monitor(self):
         """builds a report similar to the web ui"""
-        body = self.client.nodes.list()
-        if 'error' in body._asdict():
-            raise LighthouseError('Lighthouse says: %s' % body.error[0].text)
-
-        nodes = body.nodes
-
-        body = self.client.system.licenses.list()
-        if 'error' in body._asdict():
-            raise LighthouseError('Lighthouse says: %s' % body.error[0].text)
-        licenses = body.licenses
-
-        body = self.client.system.entitlements.list()
-        if 'error' in body._asdict():
-            raise LighthouseError('Lighthouse says: %s' % body.error[0].text)
-        entitlements = body.entitlements
-
-        connected, pending, disconnected = self.get_summary()
+        # the four requests are independent, so they run at the same time
+        futures = [_EXECUTOR.submit(self._tracked, call) for call in [ \
+            self._list_nodes, \
+            partial(self._cached_call, 'licenses', \
+                self.client.system.licenses.list), \
+            partial(self._cached_call, 'entitlements', \
+                self.client.system.entitlements.list), \
+            self.get_summary]]
+        nodes, licenses, entitlements, summary = \
+            [self._tracked_result(future) for future in futures]
+        licenses = licenses.licenses
+        entitlements = entitlements.entitlements
+        connected, pending, disconnected = summary
+
+        now = time.time()
+        max_devices = 0
+        expiry_epoch = 0
+        for e in entitlements:
+            maintenance = e.features.maintenance
+            if maintenance >= now:
+                max_devices += e.features.nodes
+            if maintenance > expiry_epoch:
+                expiry_epoch = maintenance
+        devices = sum(1 for n in nodes if n.status == 'Enrolled')
+        expiry = time.strftime('%m/%d/%Y', time.localtime(expiry_epoch))
+        status = 'In Compliance' if devices <= max_devices \
+            and expiry_epoch >= now else 'Not in Compliance'
 
-        dashboard = """
+        return f"""
 Current Node Status:
-{nodes_status}
-
 
-Licensing Information:
-{licensing}"""
-
-        node_template = """
->  {node_name}:
->    {node_status}: last status change {time_change} ago
->    Web UI: <{url}/{node_id}>"""
-
-        nodes_info = []
-
-        for node in sorted(nodes, key=lambda n: n.name):
-            if node.status == 'Enrolled':
-                nodes_info.append(str.format(node_template, \
-                    node_name=node.name, \
-                    node_status=node.runtime_status.connection_status, \
-                    time_change=self._format_time(\
-                        node.runtime_status.change_delta), \
-                    url=self.url, \
-                    node_id=node.id))
-
-        nodes_status = str.format("""
 >  Connected: {connected}
 >  Pending: {pending}
->  Disconnected: {disconnected}""",connected=connected, pending=pending, \
-  disconnected=disconnected)
+>  Disconnected: {disconnected}
 
-        max_devices = sum([e.features.nodes for e in entitlements \
-            if e.features.maintenance >= time.time()])
-        devices = len([n for n in nodes if n.status == 'Enrolled'])
-        expiry_epoch = max([e.features.maintenance for e in entitlements])
-        expiry = time.strftime('%m/%d/%Y', time.localtime(expiry_epoch))
-        status = 'In Compliance' if devices <= max_devices \
-            and expiry_epoch >= time.time() else 'Not in Compliance'
 
-        licensing = str.format("""
->  Number of Installed Licenses: {installed}
+Licensing Information:
+
+>  Number of Installed Licenses: {len(licenses)}
 >  Number of Supported Devices: {devices} / {max_devices}
 >  Expiry Date: {expiry}
->  Status: {status}""", installed=len(licenses), devices=devices, \
-  max_devices=max_devices, expiry=expiry,  status=status)
-
-        return str.format(dashboard, nodes_status=nodes_status, \
-            licensing=licensing)
+>  Status: {status}"""
 
     def get_node_info(self, node_name, smartgroup=None):
         """builds a full description of a node
         :node_name is the node's name
         """
         query = self.get_smart_group_query(smartgroup)
-        body = self.client.nodes.list(json=query)
-        if 'error' in body._asdict():
-            raise LighthouseError('Lighthouse says: %s' % body.error[0].text)
-        nodes = body.nodes
 
+        # a cached listing is read as it is, otherwise Lighthouse is asked for
+        # the named node first, its filter might not ignore the case though,
+        # so when it finds nothing or fails the listing is read page by page
+        # and only up to the sought node
+        sought = node_name.lower()
+        nodes = self._iter_nodes(json=query)
+        if not self.caches['nodes'].get(self._nodes_key(None, \
+            { 'json' : query })):
+            nodes = chain(self._named_nodes(node_name, json=query), nodes)
         for node in nodes:
-            if node.name.lower() == node_name.lower():
+            if node.name.lower() == sought:
                 network = ''
                 lan = ''
                 modem = ''
                 for i in node.interfaces:
-                    if i.name == 'Network' and 'ipv4_addr' in i._asdict():
+                    if i.name == 'Network' and hasattr(i, 'ipv4_addr'):
                         network = i.ipv4_addr
                     elif i.name == 'Management LAN' \
-                        and 'ipv4_addr' in i._asdict():
+                        and hasattr(i, 'ipv4_addr'):
                         lan = i.ipv4_addr
                     elif i.name == 'Internal Cellular Modem' \
-                        and 'ipv4_addr' in i._asdict():
+                        and hasattr(i, 'ipv4_addr'):
                         modem = i.ipv4_addr
-                node_status=node.runtime_status.connection_status
-                time_change=self._format_time(node.runtime_status.change_delta)
-                return str.format("""
+                status = node.runtime_status.connection_status
+                change = self._format_time(node.runtime_status.change_delta)
+                return f"""
 *{node_name}*
 > Connection Status: *{status}*, last status change {change} ago
-> Model: {model}
-> Firmware Version: {firmware}
-> Enrollment Bundle: {bundle}
-> Management VPN Address: {vpn}
-> NET1 MAC address: {mac}
+> Model: {node.model}
+> Firmware Version: {node.firmware_version}
+> Enrollment Bundle: {node.enrollment_bundle}
+> Management VPN Address: {node.lhvpn_address}
+> NET1 MAC address: {node.mac_address}
 > Network: {network}
 > Management LAN: {lan}
 > Internal Cellular Modem: {modem}
-> Serial Number: {serial}
-> Access Web UI: <{url}>
-""", model=node.model, firmware=node.firmware_version, \
-    bundle=node.enrollment_bundle, vpn=node.lhvpn_address, \
-    mac=node.mac_address, network=network, lan=lan, modem=modem, \
-    serial=node.serial_number, url='<%s/%s>' % (self.url, node.id), \
-    status=node_status, change=time_change, node_name=node_name)
+> Serial Number: {node.serial_number}
+> Access Web UI: <<{self.url}/{node.id}>>
+"""
 
-        return 'Information not found for node: [%s]' % node
+        return 'Information not found for node: [%s]' % node_name
 
     def get_device_info(self, device, smartgroup):
         """returns a formatted list of devices that match :device name
@@ -561,41 +1160,39 @@ Licensing Information:
         """
         try:
             query = self.get_smart_group_query(smartgroup)
-            body = self.client.ports.list(json=query)
-            if 'error' in body._asdict():
-                raise LighthouseError('Lighthouse says: %s' \
-                    % body.error[0].text)
-            ports = body.ports
-
-            clean_ports = []
-            for p in ports:
-                if p.label.lower() == device.lower():
-                    clean_ports.append({
-                        'name': p.label,
-                        'node_name': p.node_name,
-                        'change': self._format_time(p.runtime_status.change_delta),
-                        'status': p.runtime_status.connection_status,
-                        'web': '<%s/%s>' % (self.url, p.web_terminal_url) \
-                            if 'web_terminal_url' in p._asdict() else '',
-                        'ssh': '<%s>' % p.proxied_ssh_url \
-                            if 'proxied_ssh_url' in p._asdict() else ''
-                    })
-            ports = sorted(clean_ports, \
-                key=lambda x: x['node_name'] + x['name'])
-
-            monitor_template = """
+            ports = self._cached_call('ports', self.client.ports.list, \
+                json=query).ports
+
+            url = self.url
+            format_time = self._format_time
+
+            def render(p):
+                """formats a port, the f-string is compiled once rather than
+                parsed for every port like a str.format template"""
+                web = '<%s/%s>' % (url, p.web_terminal_url) \
+                    if hasattr(p, 'web_terminal_url') else ''
+                ssh = '<%s>' % p.proxied_ssh_url \
+                    if hasattr(p, 'proxied_ssh_url') else ''
+                status = p.runtime_status
+                return f"""
+> Node: {p.node_name}
+> Device: {p.label}
+> Status: {status.connection_status}, last status change \
+{format_time(status.change_delta)} ago
+> Web Terminal: {web}
+> SSH: {ssh}"""
+
+            # each matching port is formatted right away, next to its sort key
+            device = device.lower()
+            rows = [(p.node_name + p.label, render(p)) for p in ports \
+                if p.label.lower() == device]
+            rows.sort(key=lambda row: row[0])
+            devices_list = '\n'.join(line for _, line in rows)
+            return f"""
 Devices Monitor:
 {devices_list}
 """
-            device_template = """
-> Node: {node_name}
-> Device: {name}
-> Status: {status}, last status change {change} ago
-> Web Terminal: {web}
-> SSH: {ssh}"""
-            return str.format(monitor_template, devices_list='\n'.join(\
-                [str.format(device_template, **p) for p in ports]))
-        except LighthouseError as error:
+        except (LighthouseError, RequestException) as error:
             raise error
         except:
             return 'Problem finding device'
@@ -606,15 +1203,14 @@ Devices Monitor:
 
         :time_sec a time interval in seconds
         """
-        sec = timedelta(seconds=time_sec)
-        d = datetime(1,1,1) + sec
-        if d.day-1 > 0:
-            return '%d days' % (d.day-1)
-        elif d.hour > 0:
-            return '%d hours' % d.hour
-        elif d.minute > 0:
-            return '%d minutes' % d.minute
-        return '%d seconds' % d.second
+        time_sec = int(time_sec)
+        if time_sec >= 24 * 60 * 60:
+            return '%d days' % (time_sec // (24 * 60 * 60))
+        elif time_sec >= 60 * 60:
+            return '%d hours' % (time_sec // (60 * 60))
+        elif time_sec >= 60:
+            return '%d minutes' % (time_sec // 60)
+        return '%d seconds' % time_sec
 
 class OgLhSlackBot:
     """A Bot for dealing with the Opengear Lighthouse API straight from Slack
@@ -638,8 +1234,14 @@ class OgLhSlackBot:
             '(%(threadName)-10s) %(message)s')
         fh.setFormatter(formatter)
         ch.setFormatter(formatter)
-        self.logger.addHandler(fh)
-        self.logger.addHandler(ch)
+        # the handlers write from their own thread, so that the commands
+        # never wait on the log file
+        self.log_queue = queue.Queue(-1)
+        self.logger.addHandler(QueueHandler(self.log_queue))
+        self.log_listener = QueueListener(self.log_queue, fh, ch, \
+            respect_handler_level=True)
+        self.log_listener.start()
+        atexit.register(self.log_listener.stop)
 
         self.bot_name = os.environ.get('SLACK_BOT_NAME')
         self.default_channel = os.environ.get('SLACK_BOT_DEFAULT_CHANNEL')
@@ -655,12 +1257,35 @@ documentation: https://github.com/opengear/oglhslack
             os.environ.get('SLACK_BOT_DEFAULT_LOG_CHANNEL') or self.default_channel
         self.admin_channel = \
             os.environ.get('SLACK_BOT_ADMIN_CHANNEL') or 'oglhadmin'
-
-        # the max number of threads is equals to the number of cpus
-        self.poll_max = multiprocessing.cpu_count()
-        self.semaphores = threading.BoundedSemaphore(value=self.poll_max)
+        self.help_text = self._build_help()
+        # recent replies of the built in functions, see cached_reply
+        self.replies = TTLCache(ttl=10)
+        self.advanced_help_text = self._build_advanced_help()
+
+        # commands mostly wait on slack and lighthouse, so there are more
+        # workers than cpus; a command arriving while all of them are busy is
+        # turned down rather than queued behind the slow ones
+        self.poll_max = int(os.environ.get('SLACK_BOT_MAX_COMMANDS') \
+            or max(32, 2 * multiprocessing.cpu_count()))
+        self.pool = ThreadPoolExecutor(max_workers=self.poll_max, \
+            thread_name_prefix='oglh')
+        self.command_slots = threading.BoundedSemaphore(self.poll_max)
         self.poll_interval = 1
-        self.poll_count = 0
+        # seconds the bot waits for slack events at most before reading again
+        self.heartbeat_interval = 30
+        self.selector = selectors.DefaultSelector()
+        self.selector_sock = None
+        self.pending_interval = 10
+
+        # slack usernames by user id
+        self.usernames = TTLCache(ttl=60 * 60, maxsize=1024)
+
+        # channel names and ids, listed at once and kept for :channels_ttl
+        self.channel_names = {}
+        self.channel_ids = {}
+        self.channels_lock = threading.Lock()
+        self.channels_ttl = 10 * 60
+        self.channels_expiry = 0
         self.restart_interval = 15
 
         self.func_intents = { \
@@ -682,28 +1307,57 @@ documentation: https://github.com/opengear/oglhslack
             self._show_advanced_help : { 'advanced', 'advanced-help' },
         }
 
+        # reverse lookup for the intents as (function, admin only), the first
+        # function listing an intent keeps it
+        self.intent_funcs = {}
+        for func, intents in self.func_intents.items():
+            for intent in intents:
+                self.intent_funcs.setdefault(intent, \
+                    (func, 'admin' in intents))
+
+        self.client_helper = None
+        self.clients_lock = threading.Lock()
+        # slack web api calls share its connections across reconnections
+        self.slack_requester = SlackSessionRequest()
         self._start_clients()
 
-        if not self.slack_client.rtm_connect():
-            raise RuntimeError('Slack connection failed')
-
         self.bod_id = self._get_bot_id()
         self.bot_at = '<@' + self.bod_id + '>'
         self.admin_channel_id = self._get_channel_id(self.admin_channel)
 
     @retry(tries=10)
     def _start_clients(self):
-        """it starts or restarts slack and lighthouse clients when necessary
+        """it starts or restarts the slack client and its RTM connection, the
+        lighthouse client is started only once, so that its session and
+        caches outlive slack reconnections
         """
-        try:
-            self.slack_client = SlackClient(self.slack_token)
-        except:
-            raise RuntimeError('Slack read failed, ' + \
-                'please check your token')
-        try:
-            self.client_helper = OgLhClientHelper()
-        except:
-            raise RuntimeError('Problems accessing Lighthouse API')
+        with self.clients_lock:
+            try:
+                slack_client = self._new_slack_client()
+            except Exception as error:
+                raise RuntimeError('Slack read failed, ' + \
+                    'please check your token') from error
+            if not slack_client.rtm_connect():
+                raise RuntimeError('Slack connection failed')
+            self.slack_client = slack_client
+
+        if self.client_helper:
+            return
+        with self.clients_lock:
+            if self.client_helper:
+                return
+            try:
+                self.client_helper = OgLhClientHelper()
+            except Exception as error:
+                raise RuntimeError('Problems accessing Lighthouse API') \
+                    from error
+
+    def _new_slack_client(self):
+        """returns a slack client making its web api calls through
+        :slack_requester"""
+        slack_client = SlackClient(self.slack_token)
+        slack_client.server.api_requester = self.slack_requester
+        return slack_client
 
     def listen(self):
         """Listen Slack channels for messages addressed to oglh slack bot"""
@@ -714,29 +1368,30 @@ documentation: https://github.com/opengear/oglhslack
                     if launching:
                         self._logging('Hi there! I am here to help!', \
                             force_slack=True)
+                        t = threading.Thread(target=self._watch_pending)
+                        t.setDaemon(True)
+                        t.start()
                         launching = False
 
                     while True:
-                        command, channel, user_id = \
-                                self._read(self.slack_client.rtm_read())
+                        output_list = self.slack_client.rtm_read()
+                        command, channel, user_id = self._read(output_list)
 
                         if command and channel and user_id:
-                            t = threading.Thread(target=self._command, \
-                                args=(command, channel, user_id))
-                            t.setDaemon(True)
-                            t.start()
+                            self._submit_command(command, channel, user_id)
 
-                        if self.poll_count % 10 == 0:
-                            self._command('pending new_only', \
-                                self.admin_channel_id, None)
-                            self.poll_count = 0
-
-                        self.poll_count += self.poll_interval
-                        time.sleep(self.poll_interval)
+                        # rtm_read returns one event at a time, so there
+                        # might be more of them already buffered
+                        if not output_list:
+                            self._wait_for_events()
 
                 except KeyboardInterrupt:
                     self._logging('Slack bot was interrupt manually', \
                         level=logging.WARNING)
+                    # the signal skips atexit, so the queued records are
+                    # flushed beforehand
+                    atexit.unregister(self.log_listener.stop)
+                    self.log_listener.stop()
                     os.kill(os.getpid(), signal.SIGUSR1)
 
                 except Exception as error:
@@ -750,6 +1405,54 @@ documentation: https://github.com/opengear/oglhslack
             except Exception as error:
                 self._logging('Error starting clients: %s' % error)
 
+    def _wait_for_events(self):
+        """blocks until there is something to be read from the slack
+        websocket, or :heartbeat_interval seconds at most, instead of sleeping
+        between reads regardless of incoming messages
+        """
+        websocket = self.slack_client.server.websocket
+        sock = websocket.sock if websocket else None
+        if not sock:
+            time.sleep(self.poll_interval)
+            return
+
+        # data already decrypted by the ssl layer does not wake the selector
+        if hasattr(sock, 'pending') and sock.pending():
+            return
+
+        # a reconnection brings a new socket
+        if sock is not self.selector_sock:
+            self.selector.close()
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(sock, selectors.EVENT_READ)
+            self.selector_sock = sock
+
+        self.selector.select(timeout=self.heartbeat_interval)
+
+    def _watch_pending(self):
+        """periodically warns the admin channel about new nodes waiting for
+        approval, its requests also keep the Lighthouse session in use; it
+        runs on its own thread so that the Lighthouse round trips never delay
+        the reading of Slack messages
+        """
+        while True:
+            # most sweeps find no new pending nodes, so the command handling
+            # (usernames, channel names, license checks) only takes place
+            # when there is something to be said
+            try:
+                response = self._check_pending(True, None)
+                if response:
+                    if self.client_helper.is_evaluation():
+                        response = _MSG_EVALUATION + response
+                    self._logging('Responding: ' + response)
+                    self.slack_client.api_call('chat.postMessage', \
+                        channel=self.admin_channel_id, text=response, \
+                        as_user=True)
+            except Exception as error:
+                self._logging(str(error), level=logging.ERROR, \
+                    error_stack=error)
+            time.sleep(self.pending_interval)
+
     def _read(self, output_list):
         """reads slack messages in channels where the bot has access
         (PM, channels enrolled, etc)
@@ -760,6 +1463,15 @@ documentation: https://github.com/opengear/oglhslack
         """
         if output_list and len(output_list) > 0:
             for output in output_list:
+                # keep the cached channels and usernames up to date
+                if output and output.get('type') in ('channel_created', \
+                    'channel_deleted', 'channel_rename', 'channel_joined', \
+                    'group_rename', 'group_joined'):
+                    self._forget_channels()
+                elif output and output.get('type') == 'user_change':
+                    self.usernames.set(output['user']['id'], \
+                        output['user']['name'])
+
                 if output and 'text' in output and \
                     self.bot_at in output['text']:
                     command = \
@@ -776,10 +1488,43 @@ documentation: https://github.com/opengear/oglhslack
                         output['user']
         return None, None, None
 
+    def _submit_command(self, command, channel, user_id):
+        """hands a command over to the :pool workers, or replies that the
+        bot is busy when :poll_max commands are already running
+
+        :command, :channel and :user_id are as in _command
+        """
+        if not self.command_slots.acquire(blocking=False):
+            # only to the log file, and the reply is posted from another
+            # thread, the listener should not wait on slack
+            self.logger.warning('Busy, turning down command: `%s`', command)
+            _EXECUTOR.submit(self._reply_busy, channel)
+            return
+        try:
+            self.pool.submit(self._run_command, command, channel, user_id)
+        except:
+            self.command_slots.release()
+            raise
+
+    def _reply_busy(self, channel):
+        """tells :channel that its command was turned down"""
+        try:
+            self.slack_client.api_call('chat.postMessage', \
+                channel=channel, text=_MSG_BUSY, as_user=True)
+        except:
+            pass
+
+    def _run_command(self, command, channel, user_id):
+        """runs :command on a worker, giving its slot back afterwards"""
+        try:
+            self._command(command, channel, user_id)
+        finally:
+            self.command_slots.release()
+
     def _command(self, command, channel, user_id):
         """tries to execute a command received in some of the available channels
-        or private messages. It has a semaphore for assuring that no more
-        commands are executed simultaneously than the number of cpus
+        or private messages. It runs on the :pool workers, so that no more
+        than :poll_max commands are executed simultaneously
 
         :command is a string carriying the command, it might be empty, a single
         word or many words
@@ -787,7 +1532,6 @@ documentation: https://github.com/opengear/oglhslack
         :user_id is the id of the user who sent the message
         """
         try:
-            self.semaphores.acquire()
             response = ''
             is_help = False
 
@@ -796,18 +1540,19 @@ documentation: https://github.com/opengear/oglhslack
             channel_name = self._get_channel_name(channel)
 
             if user_id:
-                self._logging(str.format('Got command: `{command}`, from: ' + \
-                    '{username}', command=command, username=username))
-                response = '<@' + user_id + '|' + username + '> '
+                self._logging(f'Got command: `{command}`, from: {username}')
+                response = f'<@{user_id}|{username}> '
 
             try:
+                # pool threads are reused, the stale answers of earlier
+                # commands are not this one's
+                self.client_helper.begin_request()
                 #if not self.client_helper.is_license_valid():
                 #    response += '\n\n*We were not able of validating your ' + \
                 #        'license key, please check the status of your ' + \
                 #        'signature* :rage:\n\n'
                 if self.client_helper.is_evaluation():
-                    response += '*WARNING:* Lighthouse is currently ' + \
-                        'running in evaluation mode. :slightly_frowning_face:\n'
+                    response += _MSG_EVALUATION
 
                 # check whether some of the built in funtions were called
                 output = self._built_in_functions(command, channel_name, \
@@ -822,14 +1567,16 @@ documentation: https://github.com/opengear/oglhslack
                 raise ie
 
             if output:
+                if self.client_helper.served_stale():
+                    response += _MSG_STALE
                 response += output
                 self._logging('Responding: ' + \
                     (response if not is_help else 'help message'))
                 try:
                     self.slack_client.api_call('chat.postMessage', \
                         channel=channel, text=response, as_user=True)
-                except:
-                    raise RuntimeError('Slack post failed')
+                except _SLACK_ERRORS as error:
+                    raise RuntimeError('Slack post failed') from error
 
         except Exception as e:
             self._logging(str(e), level=logging.ERROR, error_stack=e)
@@ -840,46 +1587,92 @@ documentation: https://github.com/opengear/oglhslack
                         as_user=True)
             except:
                 pass
-        finally:
-            self.semaphores.release()
 
     @retry(tries=5)
     def _get_bot_id(self):
         """return the slack id for the bot specified at SLACK_BOT_NAME env var
         """
+        # the token normally belongs to the bot itself, which auth.test tells
+        # in a single call instead of listing every user of the workspace
+        try:
+            identity = self.slack_client.api_call('auth.test')
+        except _SLACK_ERRORS:
+            identity = None
+        if identity and identity.get('user') == self.bot_name \
+            and identity.get('user_id'):
+            self.usernames.set(identity['user_id'], identity['user'])
+            return identity['user_id']
+
         try:
             users_list = self.slack_client.api_call('users.list')
-        except:
+        except _SLACK_ERRORS as error:
             raise RuntimeError('Slack users list failed, ' + \
-                'please check your token')
+                'please check your token') from error
+        # the whole list is at hand, so it warms up the usernames cache too
+        self.usernames.update((member['id'], member['name']) \
+            for member in users_list['members'])
         for member in users_list['members']:
             if member['name'] == self.bot_name:
                 return member['id']
         raise RuntimeError('User ' + self.bot_name + ' not found')
 
+    def _channels(self):
+        """returns the (names by id, ids by name) maps of the public and
+        private channels, they are listed again from slack once expired or
+        forgotten
+
+        @return a tuple of dicts, which are replaced and never updated in place
+        """
+        with self.channels_lock:
+            if self.channels_expiry > time.monotonic():
+                return self.channel_names, self.channel_ids
+
+            try:
+                channel_list = self.slack_client.api_call('channels.list')
+            except _SLACK_ERRORS as error:
+                raise RuntimeError('Slack channels list failed') from error
+            try:
+                group_list = self.slack_client.api_call('groups.list')
+            except _SLACK_ERRORS as error:
+                raise RuntimeError('Slack private channels list failed') \
+                    from error
+
+            # a refused listing, like a token without the groups scope, leaves
+            # its channels out instead of failing every command
+            for method, listing in (('channels.list', channel_list), \
+                ('groups.list', group_list)):
+                if not listing.get('ok'):
+                    self.logger.warning('Slack %s failed: %s', method, \
+                        listing.get('error'))
+
+            # public channels take precedence over private ones
+            channel_names = {}
+            channel_ids = {}
+            for c in channel_list.get('channels', []) + \
+                group_list.get('groups', []):
+                channel_names.setdefault(c['id'], c['name'])
+                channel_ids.setdefault(c['name'], c['id'])
+
+            self.channel_names = channel_names
+            self.channel_ids = channel_ids
+            # the public channels are asked for again at the next lookup
+            # until slack lists them
+            if channel_list.get('ok'):
+                self.channels_expiry = time.monotonic() + self.channels_ttl
+            return channel_names, channel_ids
+
+    def _forget_channels(self):
+        """makes the next channel lookup list the channels from slack again"""
+        with self.channels_lock:
+            self.channels_expiry = 0
+
     @retry(tries=5)
     def _get_channel_name(self, channel_id):
         """returns the friendly name of a channel given its id
 
         :channel_id is the slack id of the sought channel
         """
-        try:
-            channel_list = self.slack_client.api_call('channels.list')
-        except:
-            raise RuntimeError('Slack channels list failed')
-        for c in channel_list['channels']:
-            if c['id'] == channel_id:
-                return c['name']
-
-        try:
-            channel_list = self.slack_client.api_call('groups.list')
-        except:
-            raise RuntimeError('Slack private channels list failed')
-
-        for c in channel_list['groups']:
-            if c['id'] == channel_id:
-                return c['name']
-        return None
+        return self._channels()[0].get(channel_id)
 
     @retry(tries=5)
     def _get_channel_id(self, channel_name):
@@ -887,23 +1680,7 @@ documentation: https://github.com/opengear/oglhslack
 
         :channel_name is the slack id of the sought channel
         """
-        try:
-            channel_list = self.slack_client.api_call('channels.list')
-        except:
-            raise RuntimeError('Slack channels list failed')
-        for c in channel_list['channels']:
-            if c['name'] == channel_name:
-                return c['id']
-
-        try:
-            channel_list = self.slack_client.api_call('groups.list')
-        except:
-            raise RuntimeError('Slack private channels list failed')
-
-        for c in channel_list['groups']:
-            if c['name'] == channel_name:
-                return c['id']
-        return None
+        return self._channels()[1].get(channel_name)
 
     @retry(tries=5)
     def _get_slack_username(self, user_id):
@@ -913,13 +1690,19 @@ documentation: https://github.com/opengear/oglhslack
         :user_id is the slack id of the sought user
         """
         if user_id:
+            username = self.usernames.get(user_id)
+            if username:
+                return username
+
             try:
                 info = self.slack_client.api_call('users.info', user=user_id)
-            except:
-                raise RuntimeError('Error getting Slack\'s username by id')
+            except _SLACK_ERRORS as error:
+                raise RuntimeError('Error getting Slack\'s username by id') \
+                    from error
 
             username = info['user']['name']
             if username:
+                self.usernames.set(user_id, username)
                 return username
         return 'friend'
 
@@ -941,16 +1724,15 @@ documentation: https://github.com/opengear/oglhslack
 
         scope = self._sanitise(scope)
 
-        for func, intents in self.func_intents.items():
-            if intent in intents and (channel == self.admin_channel or \
-                not 'admin' in intents):
-                scope, smartgroup = self._split_scope_smartgroup(scope)
-                return func(scope, smartgroup, username)
-            elif intent in intents and channel != self.admin_channel \
-                and 'admin' in intents:
-                return "This operation must take place at `%s` channel." % \
-                    self.admin_channel
-        return None
+        entry = self.intent_funcs.get(intent)
+        if entry is None:
+            return None
+        func, needs_admin = entry
+        if needs_admin and channel != self.admin_channel:
+            return "This operation must take place at `%s` channel." % \
+                self.admin_channel
+        scope, smartgroup = self._split_scope_smartgroup(scope)
+        return func(scope, smartgroup, username)
 
     def _query_tool(self, command, channel):
         """tries to parse the :command as query, with a proper syntax specified
@@ -963,7 +1745,7 @@ documentation: https://github.com/opengear/oglhslack
         not authorized channels
         """
         try:
-            action, _, scope = re.sub('\s+', ' ', command).partition(' ')
+            action, _, scope = _WHITESPACE_RE.sub(' ', command).partition(' ')
             action = action.lower()
             scope = self._sanitise(scope.strip())
 
@@ -976,8 +1758,8 @@ documentation: https://github.com/opengear/oglhslack
                     "must take place at `%s` channel." % \
                     self.admin_channel, False
             else:
-                params=[]
-                chain = []
+                kwargs = {}
+                attr_chain = []
                 main_parts = []
 
                 object_type = None
@@ -987,11 +1769,11 @@ documentation: https://github.com/opengear/oglhslack
                 parent_id = None
                 smartgroup = None
 
-                if re.match('.*\s+in\s+\w+', scope):
+                if _QUERY_SMARTGROUP_RE.match(scope):
                     scope = scope.split(' in ')
                     smartgroup = scope[1].strip()
                     query = self.client_helper.get_smart_group_query(smartgroup)
-                    params.append('json=\'%s\'' % query)
+                    kwargs['json'] = query
                     scope = scope[0]
 
                 if 'from' in scope:
@@ -999,19 +1781,19 @@ documentation: https://github.com/opengear/oglhslack
                     main_parts = objects[0].strip().split(' ')
                     parent_parts = objects[1].strip().split(' ')
                     parent_type = self._dummy_plural(parent_parts[0])
-                    chain.append(parent_type)
+                    attr_chain.append(parent_type)
                     if len(parent_parts) == 2:
                         parent_name = parent_parts[1]
                         parent_id = self.client_helper.get_object_id(\
                             parent_type, parent_name)
-                        params.append('parent_id="%s"' % parent_id)
+                        kwargs['parent_id'] = parent_id
                 else:
                     main_parts = scope.strip().split(' ')
 
                 object_type = self._dummy_plural(main_parts[0])
                 if object_type == 'devices':
                     object_type = 'ports'
-                chain.append(object_type)
+                attr_chain.append(object_type)
 
                 if len(main_parts) == 2:
                     if action_type == 'simple':
@@ -1020,8 +1802,12 @@ documentation: https://github.com/opengear/oglhslack
                     object_id = self.client_helper.get_object_id(\
                             object_type, object_name, \
                             parent_type=parent_type, \
-                            parent_name=parent_name)
-                    params.append('id="%s"' % object_id)
+                            parent_name=parent_name, \
+                            parent_id=parent_id)
+                    # there is no such object, no point asking for it
+                    if object_id is None:
+                        return self._show_help(), True
+                    kwargs['id'] = object_id
 
                 if object_type in ['devices', 'ports'] and \
                     parent_type == 'nodes' and action == 'list' and \
@@ -1031,29 +1817,48 @@ documentation: https://github.com/opengear/oglhslack
                             node_name=parent_name, \
                             smartgroup=smartgroup)), False
 
-                call_str = 'self.client_helper.client.' + \
-                    '{chain}.{action}({params})'
-                r = eval(str.format(call_str, chain='.'.join(chain), \
-                    action=action, params=','.join(params)))
+                target = reduce(getattr, attr_chain, self.client_helper.client)
+                r = getattr(target, action)(**kwargs)
 
-                if 'error' in r._asdict() and \
-                    'Could not find element' in r.error[0].text:
+                error = getattr(r, 'error', None)
+                if error and 'Could not find element' in error[0].text:
                     # lets try to be smart
                     try:
-                        r2 = eval(str.format(call_str, chain='.'.join(chain), \
-                            action='list', params=','.join(params)))
-                        for o in r2._asdict()[object_type]:
-                            if o.id == object_id:
-                                return self._format_response(action, r2), False
+                        r2 = target.list(**kwargs)
+                        if any(o.id == object_id \
+                            for o in getattr(r2, object_type)):
+                            return self._format_response(action, r2), False
                     except:
                         pass
 
                 return self._format_response(action, r), False
-        except:
+        except (LighthouseError, RequestException) as error:
+            raise error
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+            # commands which do not follow the api structure, other errors
+            # are logged by _command
             return self._show_help(), True
 
     # built in functions
 
+    def _port_links(self, port, username=None, web=True):
+        """the ssh link followed by the web link of a port, for those it has
+
+        :port a port object
+        :username the user's slack username, if None no ssh link is given
+        :web if False, no web link is given
+        """
+        links = []
+        ssh_url = getattr(port, 'proxied_ssh_url', None)
+        if ssh_url and username is not None:
+            links.append('<' + ssh_url.replace('ssh://' + \
+                self.client_helper.lh_api.username, 'ssh://' + username, 1) \
+                + '>')
+        web_url = getattr(port, 'web_terminal_url', None)
+        if web_url and web:
+            links.append('<' + self.client_helper.url + '/' + web_url + '>')
+        return links
+
     def _ports_list_ssh(self, ports, label, username):
         """ssh connection strings for devices
 
@@ -1061,15 +1866,8 @@ documentation: https://github.com/opengear/oglhslack
         :label the label of the port to build the url
         :username it is the user's slack username
         """
-        ssh_urls = []
-        for port in ports:
-            if not 'proxied_ssh_url' in port._asdict():
-                continue
-            bot_username = self.client_helper.lh_api.username
-            ssh_url = re.sub(r'ssh://' + bot_username, 'ssh://' + username, \
-                port.proxied_ssh_url)
-            ssh_urls.append('<' + ssh_url + '>')
-        return ssh_urls
+        return [link for port in ports \
+            for link in self._port_links(port, username, web=False)]
 
     def _ports_list_web(self, ports, label):
         """web urls for devices
@@ -1077,14 +1875,7 @@ documentation: https://github.com/opengear/oglhslack
         :ports a list of ports objects
         :label the label of the port to build the url
         """
-        web_urls = []
-        for port in ports:
-            if not 'web_terminal_url' in port._asdict():
-                continue
-            web_url = self.client_helper.url + '/'
-            web_url += port.web_terminal_url
-            web_urls.append('<' + web_url + '>')
-        return web_urls
+        return [link for port in ports for link in self._port_links(port)]
 
     def _get_port_ssh(self, label, smartgroup, username):
         """returns a list of ssh links for a device
@@ -1095,8 +1886,7 @@ documentation: https://github.com/opengear/oglhslack
         ports = self.client_helper.get_ports(label, smartgroup)
         urls = self._ports_list_ssh(ports, label, username)
         if not urls:
-            return (':x: Device not found: %s. ' + \
-                'Unable to create ssh link.') % label
+            return _MSG_DEVICE_NOT_FOUND % (label, 'ssh link')
         return '\n'.join(urls)
 
     def _get_port_web(self, label, smartgroup, *_):
@@ -1108,8 +1898,7 @@ documentation: https://github.com/opengear/oglhslack
         urls = self._ports_list_web(ports, label)
 
         if not urls:
-            return (':x: Device not found: %s. ' + \
-                'Unable to create web link.') % label
+            return _MSG_DEVICE_NOT_FOUND % (label, 'web link')
         return '\n'.join(urls)
 
     def _get_port(self, label, smartgroup, username):
@@ -1119,49 +1908,47 @@ documentation: https://github.com/opengear/oglhslack
         :username the slack username
         """
         ports = self.client_helper.get_ports(label, smartgroup)
-        ssh_urls = self._ports_list_ssh(ports, label, username)
-        web_urls = self._ports_list_web(ports, label)
-
-        urls = [ x for t in zip(ssh_urls, web_urls) for x in t ]
+        urls = [link for port in ports \
+            for link in self._port_links(port, username)]
         if not urls:
-            return (':x: Device not found: %s. ' + \
-                'Unable to create ssh link and web link.') % label
+            return _MSG_DEVICE_NOT_FOUND % (label, 'ssh link and web link')
         return '\n'.join(urls)
 
     def _approve_nodes(self, str_names, *_):
         """approve or enroll a list of nodes specified by their names
         :str_names a list of nodes names
         """
-        names = str_names.split(' ')
+        # repeated names would only mean repeated requests to lighthouse
+        names = list(dict.fromkeys(str_names.split()))
+        if not names:
+            return _MSG_NO_NAMES
         approved_names, errors = self.client_helper.approve_nodes(names)
+        # the enrolled nodes and the summary are not the same anymore
+        self.replies.clear()
         for e in errors:
             self._logging(e, level=logging.ERROR)
-        response = []
-        for name in names:
-            if name in approved_names:
-                emoji = ':white_check_mark: Success: Node approved.'
-            else:
-                emoji = ':x: Error: Node could not be approved. ' + \
-                    'Please check it and try again.'
-            response.append(name + ' ' + emoji)
-        return self._format_list(response)
+        approved_names = set(approved_names)
+        return self._format_list([name + ' ' + \
+            (_MSG_APPROVE_OK if name in approved_names else _MSG_APPROVE_FAIL) \
+            for name in names])
 
     def _delete_nodes(self, str_names, *_):
         """delete or unenroll a list of nodes specified by their names
         :str_names a list of nodes names
         """
-        names = str_names.split(' ')
+        # repeated names would only mean repeated requests to lighthouse
+        names = list(dict.fromkeys(str_names.split()))
+        if not names:
+            return _MSG_NO_NAMES
         deleted_names, errors = self.client_helper.delete_nodes(names)
+        # the enrolled nodes and the summary are not the same anymore
+        self.replies.clear()
         for e in errors:
             self._logging(e, level=logging.ERROR)
-        response = []
-        for name in names:
-            if name in deleted_names:
-                status_info = ':white_check_mark: Success: '
-            else:
-                status_info = ':x: Error: It was not possible to unenroll '
-            response.append(status_info + name + '.')
-        return self._format_list(response)
+        deleted_names = set(deleted_names)
+        return self._format_list([ \
+            (_MSG_DELETE_OK if name in deleted_names else _MSG_DELETE_FAIL) \
+            % name for name in names])
 
     def _get_port_labels(self, node_name, smartgroup, *_):
         """returns a list of ports labels r a given node specified by its name
@@ -1174,6 +1961,7 @@ documentation: https://github.com/opengear/oglhslack
             response = 'No devices found'
         return response
 
+    @cached_reply
     def _get_enrolled(self, nodes, smartgroup, *args):
         """return a list of the current enrolled nodes
         """
@@ -1201,10 +1989,10 @@ documentation: https://github.com/opengear/oglhslack
             return None
 
         if pending_nodes:
-            response = ':warning: There are some nodes waiting for approval.\n'
+            response = _MSG_PENDING
             response += self._format_list(pending_nodes)
         else:
-            response = ':white_check_mark: No pending nodes to approve.'
+            response = _MSG_NO_PENDING
         return response
 
     def _get_web(self, *args):
@@ -1214,11 +2002,13 @@ documentation: https://github.com/opengear/oglhslack
         general url will be returned, or it can be ('node-name','username')
         in sucha a case the url for the given node will be returned
         """
+        url = self.client_helper.url
         if args[0]:
             node_id = self.client_helper.get_node_id(args[0]) or args[0]
-            return '<' + self.client_helper.url + '/' + node_id + '>'
-        return '<' + self.client_helper.url + '>'
+            return f'<{url}/{node_id}>'
+        return f'<{url}>'
 
+    @cached_reply
     def _get_node_summary(self, scope, *_):
         """returns a summary similar to the one at the monitor dashboard
         in the web ui, without the nodes
@@ -1228,6 +2018,7 @@ documentation: https://github.com/opengear/oglhslack
         """
         return self.client_helper.get_monitor()
 
+    @cached_reply
     def _smart_groups(self, *_):
         """return a list of smartgroups"""
         smartgroups = self.client_helper.get_smart_groups()
@@ -1271,12 +2062,13 @@ documentation: https://github.com/opengear/oglhslack
         :line is a string with a shape like above
         """
         sanitised = []
-        pattern = re.compile('^\<.*\|(.*)\>$')
         for s in line.strip().split():
-            if pattern.search(s):
-                sanitised.append(pattern.search(s).group(1))
-            else:
+            # most words are not slack entities, no need for the regex
+            if s[:1] != '<' or s[-1:] != '>' or '|' not in s:
                 sanitised.append(s)
+                continue
+            match = _SANITISE_RE.match(s)
+            sanitised.append(match.group(1) if match else s)
         return ' '.join(sanitised)
 
     def _dummy_plural(self, word):
@@ -1287,13 +2079,7 @@ documentation: https://github.com/opengear/oglhslack
         :word is a string to be transformed to its plural shape according to
         the api conventions
         """
-        if word == 'system':
-            return word
-        if word[-1] == 'y':
-            return word[:-1] + 'ies'
-        elif word[-1] == 's':
-            return word
-        return word + 's'
+        return _plural(word)
 
     def _format_response(self, action, resp):
         """formats the message according to the action
@@ -1308,42 +2094,30 @@ documentation: https://github.com/opengear/oglhslack
         :resp might be a simple string, an array, or a named tuple
         """
         try:
-            if 'error' in resp._asdict() \
-                and resp.error[0].text == 'Permission denied':
+            error = getattr(resp, 'error', None)
+            if error and error[0].text == 'Permission denied':
                 return 'Object does not exist (please check the id) ' + \
                     'or @%s is not allowed to fetch it.' % self.bot_name
 
             if action == 'list':
-                object_name = [k for k in resp._asdict() \
-                    if k != 'meta'][0]
+                object_name = next(k for k in resp._fields if k != 'meta')
+                objects = getattr(resp, object_name)
+                first_fields = objects[0]._fields
                 object_label = ''
 
-                if 'name' in resp._asdict()[object_name][0]._asdict():
-                    object_label = 'name'
-                if 'label' in resp._asdict()[object_name][0]._asdict():
+                if 'label' in first_fields:
                     object_label = 'label'
+                elif 'name' in first_fields:
+                    object_label = 'name'
 
                 if object_label == '':
-                    return textwrap.dedent("""
-                        ```
-                        """ + self._dump_obj(resp) + """
-                        ```""")
-
-                try:
-                    #names = [o._asdict()[object_label] + \
-                    #    ' (id: ' + o._asdict()['id'] + ')' \
-                    names = [o._asdict()[object_label] \
-                        for o in resp._asdict()[object_name]]
-                except:
-                    names = [o._asdict()[object_label] \
-                        for o in resp._asdict()[object_name]]
+                    return _CODE_BLOCK % self._dump_obj(resp)
 
+                names = [getattr(o, object_label) for o in objects]
                 return self._format_list(sorted(names), object_name)
-            elif action == 'find' or 'get':
-                return textwrap.dedent("""
-                    ```
-                    """ + self._dump_obj(resp) + """
-                    ```""")
+            elif action in _DUMP_ACTIONS:
+                return _CODE_BLOCK % self._dump_obj(resp)
+            return str(resp)
         except:
             return str(resp)
 
@@ -1359,20 +2133,14 @@ documentation: https://github.com/opengear/oglhslack
             #return '\n' + '\n'.join(['> %d. %s' % (i + 1, e) \
             #    for i, e in enumerate(raw_list)])
             return '\n' + '\n'.join(raw_list)
-        max_len = max([len(l) for l in raw_list])
-        cols = int (100 / max_len)
-        formated_list = ''
-        for i, word in enumerate(raw_list):
-            if i % cols == 0:
-                formated_list += '\n'
-            #formated_list += ('{:3d}. {:' + str(max_len) + 's} '\
-            #    ).format((i+1), word)
-            formated_list += ('{:' + str(max_len) + 's} ').format(word)
-        return textwrap.dedent((list_title + ':' if list_title else '') + """
-            ```
-            """ + formated_list + """
-            ```
-            """)
+        max_len = max(map(len, raw_list))
+        cols = max(1, 100 // max_len)
+        # every word is padded up to the longest one plus a space
+        cells = [word.ljust(max_len + 1) for word in raw_list]
+        formated_list = ''.join(['\n' + ''.join(cells[i:i + cols]) \
+            for i in range(0, len(cells), cols)])
+        return (list_title + ':' if list_title else '') + \
+            _CODE_BLOCK % formated_list
 
     def _dump_obj(self, obj, level=0):
         """tries to dump an object in a easy to read description of its
@@ -1384,18 +2152,16 @@ documentation: https://github.com/opengear/oglhslack
         beginning of the line, for creating an easy of reading text, which means
         for identation
         """
-        response = ''
-        for key, value in obj._asdict().items():
-            try:
-                if isinstance(value, list):
-                    response += ('\n%s:' % (" " * level + key)) + \
-                        self._dump_obj(value[0], level + 2)
-                else:
-                    response += ('\n%s:' % (" " * level + key)) + \
-                        self._dump_obj(value, level + 2)
-            except Exception as e:
-                response += '\n' + " " * level + "%s -> %s" % (key, value)
-        return response
+        parts = []
+        for key, value in zip(obj._fields, obj):
+            # lists are described by their first element
+            inner = value[0] if isinstance(value, list) and value else value
+            if hasattr(inner, '_fields'):
+                parts.append('\n%s:' % (" " * level + key))
+                parts.append(self._dump_obj(inner, level + 2))
+            else:
+                parts.append('\n' + " " * level + "%s -> %s" % (key, value))
+        return ''.join(parts)
 
     def _split_scope_smartgroup(self, scope):
         """removes the smartgroup from a command's scope
@@ -1403,12 +2169,12 @@ documentation: https://github.com/opengear/oglhslack
         :scope is the scope of a command, its parameter
         """
         smartgroup = None
-        if re.match('.*in\s+\w+', scope):
+        if _SCOPE_SMARTGROUP_RE.match(scope):
             scope, smartgroup = scope.split('in ')
         return scope.strip(), smartgroup and smartgroup.strip()
 
     def _command_on_node(self, command):
-        return re.sub('devices\s+on\s+', 'devices ', command)
+        return _DEVICES_ON_RE.sub('devices ', command)
 
     def _dying_message(self, message):
         """it is final message for the default slack channel and for the log
@@ -1418,15 +2184,14 @@ documentation: https://github.com/opengear/oglhslack
         :message is a raw final message given by slack bot before it dies
         """
         self._logging(message, level=logging.ERROR)
-        warning_message = textwrap.dedent("""
-            @""" + self.bot_name + """  went offline with error message:
-            ```
-            """ + message + """
-            ```
-            """)
-        self.slack_client = SlackClient(self.slack_token)
-        self.slack_client.api_call('chat.postMessage', \
-            channel=self.admin_channel, text=warning_message, as_user=True)
+        warning_message = _MSG_DYING % (self.bot_name, message)
+        # web api calls do not depend on the rtm connection which just failed
+        slack_client = self.slack_client or self._new_slack_client()
+        try:
+            slack_client.api_call('chat.postMessage', \
+                channel=self.admin_channel, text=warning_message, as_user=True)
+        except Exception as error:
+            self.logger.error('Error posting the dying message: %s' % error)
 
     def _logging(self, message, level=logging.INFO, force_slack=False,
         error_stack=None):
@@ -1440,13 +2205,10 @@ documentation: https://github.com/opengear/oglhslack
         try:
             if error_stack:
                 self.logger.exception(error_stack)
-            elif level == logging.CRITICAL:
-                self.logger.critical(message)
-            elif level == logging.ERROR:
-                self.logger.error(message)
-            elif level == logging.WARNING:
-                self.logger.warning(message)
-            else:
+            elif level >= logging.WARNING:
+                self.logger.log(level, message)
+            elif self.logger.isEnabledFor(logging.INFO):
+                # the message is only shortened when it is going to be logged
                 self.logger.info(message[0:100] + ('...' \
                     if len(message) > 100 else ''))
 
@@ -1455,12 +2217,7 @@ documentation: https://github.com/opengear/oglhslack
                 or level > logging.INFO or force_slack):
                 slack_message = message
                 if level > logging.INFO:
-                    slack_message = textwrap.dedent("""
-                        @""" + self.bot_name + """  would like you to know:
-
-                        > """ + message + """
-
-                        """)
+                    slack_message = _MSG_LOG % (self.bot_name, message)
                 self.slack_client.api_call('chat.postMessage', \
                     channel=self.default_log_channel, \
                         text=slack_message, as_user=True)
@@ -1469,101 +2226,13 @@ documentation: https://github.com/opengear/oglhslack
 
     def _show_help(self, *_):
         """returns a text with instructions about the commands syntax"""
-        build_in_commands = [
-            {
-                'command': 'devices',
-                'description': 'Shows all the managed devices available (SG)',
-                'alias': 'ports, labels'
-            },
-            {
-                'command': 'device-info <device>',
-                'description': 'Shows the description of a device (SG)',
-                'alias': ''
-            },
-            {
-                'command': 'devices on <node>',
-                'description': 'Shows the node\'s devices (SG)',
-                'alias': 'node-ports <node>'
-            },
-            {
-                'command': 'ssh <device>',
-                'description': 'Gets a SSH link for managed Device (SG)',
-                'alias': 'sshlink <device>'
-            },
-            {
-                'command': 'web <device>',
-                'description': 'Gets a web terminal link for managed ' + \
-                    'device (SG)',
-                'alias': 'webterm <device>, weblink <device>'
-            },
-            {
-                'command': 'con <device>',
-                'description': 'Gets both a SSH link and a web terminal ' + \
-                    'link for managed device (SG)',
-                'alias': ''
-            },
-            {
-                'command': 'status',
-                'description': 'Shows nodes enrollment and licensing summary',
-                'alias': 'console <device>, gimme <device>'
-            },
-            {
-                'command': 'gui',
-                'description': 'Gets a link to the Lighthouse web UI',
-                'alias': 'lighthouse, lhweb, webui'
-            },
-            {
-                'command': 'gui <node>',
-                'description': 'Gets a link to the node\'s proxied web UI',
-                'alias': ''
-            },
-            {
-                'command': 'nodes',
-                'description': 'Shows enrolled nodes (SG)',
-                'alias': 'summary, stats, status, howzit'
-            },
-            {
-                'command': 'node-info <node>',
-                'description': 'Shows the node\'s description',
-                'alias': 'desc <node>'
-            },
-            {
-                'command': 'pending',
-                'description': 'Shows nodes awaiting approval (SG)',
-                'alias': 'enrolled'
-            },
-            {
-                'command': 'approve <node>',
-                'description': 'Approves a node or a whitespace separated ' + \
-                    'list of nodes (admin only)',
-                'alias': 'okay <node>, approve <node>'
-            },
-            {
-                'command': 'delete <node>',
-                'description': 'Unenrolls a node or a whitespace separated ' + \
-                    'list of nodes (admin only)',
-                'alias': 'kill <node>, delete <node>'
-            },
-            {
-                'command': 'smart-groups',
-                'description': 'Shows the list of smartgroups',
-                'alias': 'smart'
-            },
-            {
-                'command': 'smart-group-nodes <smartgroup>',
-                'description': 'Shows the nodes belonging to a smartgroup',
-                'alias': 'smart-nodes, smartgroupnodes'
-            },
-            {
-                'command': 'advanced',
-                'description': 'Describes some advanced commands',
-                'alias': 'advanced-help'
-            },
-        ]
-
-        max_command = max([len(c['command']) for c in build_in_commands])
-        max_desc = max([len(c['description']) for c in build_in_commands])
-        max_alias = max([len(c['alias']) for c in build_in_commands])
+        return self.help_text
+
+    def _build_help(self):
+        """builds the text returned by _show_help, which only depends on the
+        bot's name and therefore is built once"""
+        max_command, max_desc, max_alias = \
+            [max(map(len, column)) for column in zip(*_BUILT_IN_COMMANDS)]
         #head_str = '\n%s {:%ds} | {:%ds} | {:%ds}' % \
         #    (' ' * (len(self.bot_name) + 1), max_command, max_desc, max_alias)
         #line_str = '\n@%s {:%ds} | {:%ds} | {:%ds}' % \
@@ -1572,10 +2241,9 @@ documentation: https://github.com/opengear/oglhslack
             (' ' * (len(self.bot_name) + 1), max_command, max_desc)
         line_str = '\n@%s {:%ds} | {:%ds}' % \
             (self.bot_name, max_command, max_desc)
-        help_text = head_str.format('Commands', 'Description')
-
-        for c in build_in_commands:
-            help_text += line_str.format(c['command'], c['description'])
+        help_text = head_str.format('Commands', 'Description') + \
+            ''.join([line_str.format(command, description) \
+                for command, description, _ in _BUILT_IN_COMMANDS])
 
         return textwrap.dedent("""
 ```""" + help_text + """
@@ -1591,6 +2259,10 @@ In the list of commands above, those """ + \
 
     def _show_advanced_help(self, *_):
         """returns a text with instructions about the commands syntax"""
+        return self.advanced_help_text
+
+    def _build_advanced_help(self):
+        """builds the text returned by _show_advanced_help, once as well"""
         return textwrap.dedent("""
 It is also possible to query objects following *Lighthouse API* structure:
 ```